@@ -1,12 +1,32 @@
 import base64
 import os
-import tempfile
 import re
 import streamlit as st
-from utils.document_processor import process_upload
-from utils.ai_service import get_gemini_explanation
+from utils.document_processor import process_upload_bytes
+from utils.ai_service import stream_gemini_explanation
 from utils.patient_data import get_patient_data, validate_field_name, validate_insurance_id
 
+# Combined query pattern so each chat turn scans the query once instead of
+# running separate insurance-ID and field-name searches. The field alternation
+# comes first so field keywords are tagged as fields; any other token of 3+
+# characters matches the insurance group. Every field keyword also satisfies
+# the old insurance-ID pattern, so the first match overall is still the same
+# insurance-ID candidate the separate scans produced.
+_QUERY_RE = re.compile(
+    r'(?P<field>\b(?:name|father|aadhar|gender|blood|address|hospital|phone|disease|medicines|medication|bed|amount|charges)\b)'
+    r'|(?P<insurance>\b[A-Za-z0-9-]{3,}\b)',
+    re.IGNORECASE
+)
+
+# Intent triage pattern: one C-level scan replaces the three keyword-list
+# passes. The first keyword found in the query decides the branch.
+_INTENT_RE = re.compile(
+    r'(?P<med>medical|disease|medicine|symptom|diagnosis|explain|what is)'
+    r'|(?P<ins>insurance|policy|claim|deductible|coverage|premium)'
+    r'|(?P<data>data|info|details|patient|record|get|show|find)',
+    re.IGNORECASE
+)
+
 # Configure page
 st.set_page_config(
     page_title="Medical AI Assistant",
@@ -21,7 +41,10 @@ session_defaults = {
         "content": "I can help with:\n\n* Medical term explanations\n* Insurance information\n* Patient data queries"
     }],
     "current_patient": None,
-    "processed_data": {}
+    "processed_data": {},
+    # Memoized (insurance_id, field) values extracted from OCR text, so
+    # repeated queries skip the regex re-scan of the full document
+    "field_cache": {}
 }
 
 for key, default in session_defaults.items():
@@ -46,30 +69,30 @@ with st.sidebar:
 
     st.caption("Limit 200MB per file • PDF, PNG, JPG, JPEG")
 
-    # Process uploaded document
+    # Process uploaded document (cached by content, so re-uploads and
+    # Streamlit reruns of the same file skip the OCR pipeline entirely)
     if uploaded_file:
-        # Use a temporary directory to handle file paths safely
-        with tempfile.TemporaryDirectory() as temp_dir:
-            temp_path = os.path.join(temp_dir, uploaded_file.name)
-            with open(temp_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
-
-            with st.spinner("Processing document..."):
-                try:
-                    fields, text = process_upload(temp_path)
-                    if fields and fields.get("patient_id") != "Not found":
-                        patient_id = fields.get("patient_id")
-                        st.session_state.processed_data[patient_id] = {
-                            "fields": fields,
-                            "text": text,
-                            "filename": uploaded_file.name
-                        }
-                        st.session_state.current_patient = patient_id
-                        st.success(f"Processed document for Patient {patient_id}")
-                    else:
-                        st.error("Failed to extract patient ID from document")
-                except Exception as e:
-                    st.error(f"Error processing document: {str(e)}")
+        with st.spinner("Processing document..."):
+            try:
+                suffix = os.path.splitext(uploaded_file.name)[1]
+                fields, text = process_upload_bytes(uploaded_file.getvalue(), suffix)
+                if fields and fields.get("patient_id") != "Not found":
+                    patient_id = fields.get("patient_id")
+                    st.session_state.processed_data[patient_id] = {
+                        "fields": fields,
+                        "text": text,
+                        "filename": uploaded_file.name
+                    }
+                    # A re-upload replaces this patient's OCR text, so drop
+                    # any field values memoized from the previous document
+                    for cache_key in [k for k in st.session_state.field_cache if k[0] == patient_id]:
+                        del st.session_state.field_cache[cache_key]
+                    st.session_state.current_patient = patient_id
+                    st.success(f"Processed document for Patient {patient_id}")
+                else:
+                    st.error("Failed to extract patient ID from document")
+            except Exception as e:
+                st.error(f"Error processing document: {str(e)}")
 
     # Patient Selection
     if st.session_state.processed_data:
@@ -122,58 +145,54 @@ if prompt:
         st.markdown(prompt)
     st.session_state.messages.append({"role": "user", "content": prompt})
 
-    # Process query
-    query = prompt.strip().lower()
+    # Process query. No .lower() copy: the query patterns are all compiled
+    # with IGNORECASE, and only matched tokens get lowercased where needed.
+    query = prompt.strip()
     response = None
+    gemini_prompt = None
 
     try:
+        # Classify intent with a single scan of the query
+        intent_match = _INTENT_RE.search(query)
+        intent = intent_match.lastgroup if intent_match else None
+
         # Medical term explanation
-        if any(keyword in query for keyword in ["medical", "disease", "medicine", "symptom", "diagnosis", "explain", "what is"]):
-            prompt_text = f"Explain in 3 sentences: {prompt}. Use WHO definitions and simplify for patients."
-            response = get_gemini_explanation(prompt_text)
+        if intent == "med":
+            gemini_prompt = f"Explain in 3 sentences: {prompt}. Use WHO definitions and simplify for patients."
 
         # Insurance term explanation
-        elif any(keyword in query for keyword in ["insurance", "policy", "claim", "deductible", "coverage", "premium"]):
-            prompt_text = f"Explain insurance aspect: {prompt}. Cross-reference with Medicare guidelines."
-            response = get_gemini_explanation(prompt_text)
+        elif intent == "ins":
+            gemini_prompt = f"Explain insurance aspect: {prompt}. Cross-reference with Medicare guidelines."
 
         # Patient data retrieval
-        elif any(keyword in query for keyword in ["data", "info", "details", "patient", "record", "get", "show", "find"]):
-            # Look for insurance ID pattern in the query
-            insurance_id_match = re.search(r'\b[A-Za-z0-9-]{3,}\b', query)
+        elif intent == "data":
+            # Single pass over the query: the first match is the insurance-ID
+            # candidate, the first field-tagged match is the requested field.
+            query_matches = list(_QUERY_RE.finditer(query))
+            insurance_id_match = query_matches[0] if query_matches else None
+            field_match = next((m for m in query_matches if m.lastgroup == "field"), None)
+
+            field = None
+            if field_match:
+                field = field_match.group("field").lower()
+                if field == "medication":
+                    field = "medicines"  # Normalize field name
+
             if insurance_id_match:
                 insurance_id = insurance_id_match.group(0)
                 if not validate_insurance_id(insurance_id):
                     response = "Invalid Insurance ID format. Please use alphanumeric characters and hyphens only."
-                else:
-                    # Look for field name in the query
-                    field_match = re.search(
-                        r'\b(name|father|aadhar|gender|blood|address|hospital|phone|disease|medicines|medication|bed|amount|charges)\b',
-                        query,
-                        re.IGNORECASE
-                    )
-                    if field_match:
-                        field = field_match.group(0).lower()
-                        if field == "medication":
-                            field = "medicines"  # Normalize field name
-                        if validate_field_name(field):
-                            response = get_patient_data(insurance_id, field)
-                        else:
-                            response = "Invalid field name. Please specify: name, father, aadhar, gender, blood, address, hospital, phone, disease, medicines, bed, amount, or charges."
+                elif field:
+                    if validate_field_name(field):
+                        response = get_patient_data(insurance_id, field)
                     else:
-                        response = "Please specify what information you need (e.g., name, address, disease, medicines, etc.)"
+                        response = "Invalid field name. Please specify: name, father, aadhar, gender, blood, address, hospital, phone, disease, medicines, bed, amount, or charges."
+                else:
+                    response = "Please specify what information you need (e.g., name, address, disease, medicines, etc.)"
             else:
                 # Check if we have a current patient selected
                 if st.session_state.current_patient:
-                    field_match = re.search(
-                        r'\b(name|father|aadhar|gender|blood|address|hospital|phone|disease|medicines|medication|bed|amount|charges)\b',
-                        query,
-                        re.IGNORECASE
-                    )
-                    if field_match:
-                        field = field_match.group(0).lower()
-                        if field == "medication":
-                            field = "medicines"
+                    if field:
                         if validate_field_name(field):
                             response = get_patient_data(st.session_state.current_patient, field)
                         else:
@@ -185,16 +204,23 @@ if prompt:
 
         # General chat or fallback response
         else:
-            response = get_gemini_explanation(f"Respond as a helpful medical AI assistant: {prompt}")
+            gemini_prompt = f"Respond as a helpful medical AI assistant: {prompt}"
 
     except Exception as e:
         response = f"Sorry, I encountered an error: {str(e)}. Please try again."
 
     # Ensure we have a response
-    if not response:
+    if not response and not gemini_prompt:
         response = "I can help explain medical/insurance terms or retrieve patient data. Please clarify your request."
 
-    # Display response
+    # Display response, streaming Gemini answers as they arrive
     with st.chat_message("assistant"):
-        st.markdown(response)
+        if gemini_prompt and not response:
+            try:
+                response = st.write_stream(stream_gemini_explanation(gemini_prompt))
+            except Exception as e:
+                response = f"Sorry, I encountered an error: {str(e)}. Please try again."
+                st.markdown(response)
+        else:
+            st.markdown(response)
     st.session_state.messages.append({"role": "assistant", "content": response})
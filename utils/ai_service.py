@@ -1,7 +1,25 @@
+import hashlib
+import inspect
 import os
 import google.generativeai as genai
 import streamlit as st
 
+# In-process cache of Gemini responses keyed by prompt hash. The app builds
+# deterministic prompt wrappers, so repeated questions produce identical
+# payloads and can skip the network round-trip entirely.
+_RESPONSE_CACHE = {}
+_RESPONSE_CACHE_MAX = 512
+
+def _prompt_key(enhanced_prompt):
+    """Hash a prompt into a short cache key"""
+    return hashlib.blake2b(enhanced_prompt.encode(), digest_size=16).hexdigest()
+
+def _cache_response(key, text):
+    """Store a response, evicting the oldest entry when the cache is full"""
+    if len(_RESPONSE_CACHE) >= _RESPONSE_CACHE_MAX:
+        _RESPONSE_CACHE.pop(next(iter(_RESPONSE_CACHE)))
+    _RESPONSE_CACHE[key] = text
+
 # Configure Google Gemini API
 # Get API key from environment or use the provided one as fallback
 def configure_genai():
@@ -12,43 +30,12 @@ def configure_genai():
 # Configure Gemini on module import
 configure_genai()
 
-def handle_errors(func):
-    """Error handling decorator for AI functions"""
-    def wrapper(*args, **kwargs):
-        try:
-            return func(*args, **kwargs)
-        except Exception as e:
-            st.error(f"Error: {e}")
-            return f"AI service error: {str(e)}"
-    return wrapper
-
-@handle_errors
-# def get_gemini_explanation(prompt):
-#     """Get explanations from Google Gemini AI"""
-#     try:
-#         # Use gemini-1.5-flash for fast responses
-#         model = genai.GenerativeModel('gemini-1.5-flash')
-        
-#         # Enhance the prompt with specific instructions for better responses
-#         enhanced_prompt = f"""
-#         You are a medical AI assistant helping patients understand medical and insurance terms.
-#         Please provide a clear, accurate, and concise explanation of:
-        
-#         {prompt}
-        
-#         Keep your response factual, ethical, and patient-friendly. Avoid speculation.
-#         """
-        
-#         response = model.generate_content(enhanced_prompt)
-#         return response.text
-#     except Exception as e:
-#         return f"Gemini API Error: {e}"
-
-def get_gemini_explanation(prompt, audio_data=None):
-    model = genai.GenerativeModel('gemini-2.5-flash')  # Updated model
-    enhanced_prompt = f"""
+# Static instruction block shared by every request. Passing it as the system
+# instruction keeps the common prefix at the front of the request (friendly to
+# Gemini's implicit prefix caching) and leaves only the variable task text to
+# build per call.
+_SYSTEM_PREFIX = """
 **ROLE**: Medical AI assistant specializing in insurance and patient data
-**TASK**: {prompt}
 **THINKING PROCESS**:
 1. Analyze whether query requires medical/insurance explanation or data retrieval
 2. For medical terms: Use WHO definitions and simplify for patients
@@ -59,9 +46,69 @@ def get_gemini_explanation(prompt, audio_data=None):
 - Prioritize accuracy over creativity
 - Never speculate beyond source materials
 """
+
+# Construct the model once at import instead of on every call
+_MODEL = genai.GenerativeModel('gemini-2.5-flash', system_instruction=_SYSTEM_PREFIX)
+
+def handle_errors(func):
+    """Error handling decorator for AI functions, sync or async"""
+    if inspect.iscoroutinefunction(func):
+        async def wrapper(*args, **kwargs):
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                st.error(f"Error: {e}")
+                return f"AI service error: {str(e)}"
+    else:
+        def wrapper(*args, **kwargs):
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                st.error(f"Error: {e}")
+                return f"AI service error: {str(e)}"
+    return wrapper
+
+@handle_errors
+async def get_gemini_explanation(prompt, audio_data=None):
+    """Get explanations from Google Gemini AI.
+
+    Async so callers can fan out several calls with asyncio.gather
+    instead of waiting on them one by one; drive it with asyncio.run
+    from synchronous code.
+    """
     if audio_data:
+        # Audio uploads are not cacheable by prompt alone
         audio_file = genai.upload_file(audio_data)
-        response = model.generate_content([enhanced_prompt, audio_file])
-    else:
-        response = model.generate_content(enhanced_prompt)
+        response = await _MODEL.generate_content_async([prompt, audio_file])
+        return response.text
+
+    key = _prompt_key(prompt)
+    cached = _RESPONSE_CACHE.get(key)
+    if cached is not None:
+        return cached
+
+    response = await _MODEL.generate_content_async(prompt)
+    _cache_response(key, response.text)
     return response.text
+
+async def stream_gemini_explanation(prompt):
+    """Stream an explanation from Gemini chunk by chunk.
+
+    An async generator yielding text pieces as they arrive, so the UI
+    can render them incrementally while the event loop stays free;
+    st.write_stream consumes it directly. Cached prompts are yielded in
+    one piece; fresh responses are cached once the stream completes.
+    """
+    key = _prompt_key(prompt)
+    cached = _RESPONSE_CACHE.get(key)
+    if cached is not None:
+        yield cached
+        return
+
+    chunks = []
+    response = await _MODEL.generate_content_async(prompt, stream=True)
+    async for chunk in response:
+        if chunk.text:
+            chunks.append(chunk.text)
+            yield chunk.text
+    _cache_response(key, "".join(chunks))
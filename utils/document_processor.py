@@ -1,16 +1,79 @@
 import os
 import re
 import cv2
+import logging
+import multiprocessing
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+# Allow Tesseract's internal OpenMP threading to use the available cores.
+# Must be set before Tesseract is first loaded; deployments can override it.
+os.environ.setdefault("OMP_THREAD_LIMIT", str(os.cpu_count() or 1))
+
+import fitz  # PyMuPDF
 import pytesseract
 import pdfplumber
 import numpy as np
-import logging
+import regex
+import streamlit as st
 from PIL import Image
 
+# tesserocr keeps the LSTM model resident across calls, avoiding the
+# subprocess fork + model load that pytesseract pays on every invocation.
+# It needs the Tesseract C API at build time, so treat it as an optional
+# accelerator and fall back to pytesseract when it isn't installed.
+try:
+    from tesserocr import OEM, PSM, PyTessBaseAPI
+    _TESSEROCR_AVAILABLE = True
+except ImportError:
+    _TESSEROCR_AVAILABLE = False
+
 # --- Setup Logging ---
 # Set up a basic logger to provide better feedback and diagnostics.
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Extraction patterns for the different document fields, precompiled once at
+# import time so the document-processing hot path never recompiles them.
+# These patterns handle optional words and multi-line values. Compiled with
+# the third-party `regex` engine: the multi-line patterns use tempered
+# possessive quantifiers, which match in linear time instead of backtracking
+# on long OCR output the way the stdlib lazy `[\s\S]+?` forms did.
+#
+# The single-line patterns are combined into one alternation: each names its
+# value group after the field, so one finditer sweep walks the text once
+# instead of restarting a search from offset 0 per field. Values are captured
+# inside zero-width lookaheads so a match consumes only its label — finditer
+# matches cannot overlap, and a consuming [^\n]+ value would swallow the rest
+# of the line and hide any further labels sharing it (common in multi-column
+# forms flattened by OCR).
+_COMBINED_FIELD_RE = regex.compile(
+    r"(?:Patient\s)?Name\s*:\s*(?=(?P<name>[^\n]+))"
+    r"|Age\s*:\s*(?=(?P<age>\d+))"
+    r"|(?:Insurance|Patient|Record)?\s*ID\s*[:\s]*(?=(?P<patient_id>[A-Z0-9-]+))"
+    r"|(?:Disease|Diagnosis)\s*(?:Name)?\s*:\s*(?=(?P<disease>[^\n]+))"
+    r"|Gender\s*:\s*(?=(?P<gender>[^\n]+))"
+    r"|Blood(?:\sGroup)?\s*:\s*(?=(?P<blood>[^\n]+))"
+    r"|(?:Phone|Contact)\s*(?:Number)?\s*:\s*(?=(?P<phone>[^\n]+))",
+    regex.IGNORECASE | regex.VERSION1
+)
+
+# The multi-line patterns stay separate: their lookaheads don't compose
+# cleanly into the alternation above.
+_MULTILINE_FIELD_PATTERNS = {key: regex.compile(pattern, regex.IGNORECASE | regex.VERSION1) for key, pattern in {
+    # This pattern captures multi-line addresses by consuming everything up
+    # to the next known field label (or end of text)
+    "address": r"Address\s*:\s*((?:(?!\n(?:Phone|Contact|Gender|Blood|Medication))[\s\S])++)",
+    # This pattern captures a multi-line list of medications. The stray
+    # trailing " " the old pattern required after the lookahead is gone.
+    "medicines": r"Medication[s]?\s*:\s*((?:(?!\n\n|\n[A-Z][a-z]+:)[\s\S])++)"
+}.items()}
+
+# All field keys, in the order the extracted dict should present them
+_FIELD_KEYS = ("name", "age", "patient_id", "disease", "gender", "blood",
+               "address", "phone", "medicines")
+
 
 def handle_errors(func):
     """
@@ -28,111 +91,212 @@ def handle_errors(func):
     return wrapper
 
 
-def _correct_skew(image: np.ndarray) -> np.ndarray:
+# Shared Tesseract API instance, created lazily and guarded by a lock since
+# PyTessBaseAPI is not thread-safe. Each process-pool worker gets its own.
+_TESS_API = None
+_TESS_LOCK = threading.Lock()
+
+
+def _tesseract_text(image: np.ndarray) -> str:
     """
-    Corrects the skew of an image, which significantly improves OCR accuracy.
-    This function detects the text orientation and rotates the image to be level.
+    Run Tesseract on a single-channel image and return the stripped text.
+    Uses the resident tesserocr API when available; otherwise falls back
+    to spawning the tesseract binary via pytesseract.
     """
-    # Convert to grayscale and invert the image for contour detection
-    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-    gray = cv2.bitwise_not(gray)
-    
-    # Find all non-zero pixel coordinates
-    coords = np.column_stack(np.where(gray > 0))
-    
+    global _TESS_API
+    if _TESSEROCR_AVAILABLE:
+        with _TESS_LOCK:
+            if _TESS_API is None:
+                _TESS_API = PyTessBaseAPI(psm=PSM.SINGLE_BLOCK, oem=OEM.LSTM_ONLY)
+            _TESS_API.SetImage(Image.fromarray(image))
+            return _TESS_API.GetUTF8Text().strip()
+
+    # PSM 6: Assume a single uniform block of text.
+    custom_config = r'--oem 3 --psm 6'
+    return pytesseract.image_to_string(image, config=custom_config).strip()
+
+
+# Rotations below this angle are invisible to OCR, so skip the warp for them
+_SKEW_THRESHOLD_DEGREES = 0.5
+
+
+def _estimate_skew_angle(gray: np.ndarray) -> float:
+    """
+    Estimates the skew angle of a grayscale page in degrees.
+    """
+    # Estimate the angle on a downsampled copy: a 300-DPI page has tens of
+    # millions of dark pixels, and the coordinate array for minAreaRect would
+    # be hundreds of MB. ~1000 px on the long edge is plenty for an angle.
+    scale = 1000 / max(gray.shape)
+    if scale < 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+
+    # Select the dark (text) pixels directly — comparing against mid-gray
+    # fuses the old invert-then-nonzero sequence into a single pass
+    coords = np.column_stack(np.where(gray < 128))
+
+    # Blank or near-blank pages (e.g. padding pages in a text PDF) have no
+    # dark pixels, and minAreaRect raises on an empty point set. Treat them
+    # as level; they will simply OCR to an empty string.
+    if len(coords) == 0:
+        return 0.0
+
     # Get the minimum area bounding box of the text block
     angle = cv2.minAreaRect(coords)[-1]
-    
+
     # The `cv2.minAreaRect` angle can be between -90 and 0.
     # We adjust it to get the correct rotation angle.
     if angle < -45:
         angle = -(90 + angle)
     else:
         angle = -angle
-        
+    return angle
+
+
+def _correct_skew(gray: np.ndarray) -> np.ndarray:
+    """
+    Corrects the skew of a grayscale image, which significantly improves OCR
+    accuracy. Near-level pages are returned untouched so the common case of a
+    clean scan never pays for a full-image bicubic resample.
+    """
+    angle = _estimate_skew_angle(gray)
+    if abs(angle) < _SKEW_THRESHOLD_DEGREES:
+        return gray
+
     # Get the image center and compute the rotation matrix
-    (h, w) = image.shape[:2]
+    (h, w) = gray.shape[:2]
     center = (w // 2, h // 2)
     rotation_matrix = cv2.getRotationMatrix2D(center, angle, 1.0)
-    
+
     # Apply the rotation to straighten the image
-    rotated = cv2.warpAffine(image, rotation_matrix, (w, h), 
+    rotated = cv2.warpAffine(gray, rotation_matrix, (w, h),
                              flags=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
-                             
+
     logging.info(f"Corrected image skew by {angle:.2f} degrees.")
     return rotated
 
 
-def _process_image_for_ocr(image: np.ndarray) -> str:
+def _process_gray_for_ocr(gray: np.ndarray) -> str:
     """
-    Internal function to handle the OCR process on an image object.
-    This includes preprocessing and text extraction using pytesseract.
+    Internal function to handle the OCR process on a grayscale image.
+    This includes preprocessing and text extraction using Tesseract.
     """
     # 1. Correct skew
-    deskewed_image = _correct_skew(image)
-    
-    # 2. Convert to grayscale for better OCR results
-    gray = cv2.cvtColor(deskewed_image, cv2.COLOR_BGR2GRAY)
-    
-    # 3. Apply adaptive thresholding to handle varied lighting and shadows
-    threshold = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, 
+    gray = _correct_skew(gray)
+
+    # 2. Apply adaptive thresholding to handle varied lighting and shadows
+    threshold = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C,
                                       cv2.THRESH_BINARY, 11, 2)
-    
-    # 4. Use pytesseract to extract text with an optimized configuration
-    #    PSM 6: Assume a single uniform block of text.
-    custom_config = r'--oem 3 --psm 6'
-    text = pytesseract.image_to_string(threshold, config=custom_config).strip()
-    
+
+    # 3. Extract text with Tesseract (resident API when available)
+    text = _tesseract_text(threshold)
+
     # Fallback to the grayscale image if thresholding yields no text
     if not text:
         logging.warning("Thresholding produced no text. Retrying with grayscale image.")
-        text = pytesseract.image_to_string(gray, config=custom_config).strip()
-        
+        text = _tesseract_text(gray)
+
     return text
 
 
+def _process_image_for_ocr(image: np.ndarray) -> str:
+    """
+    Internal function to handle the OCR process on a BGR image object.
+    """
+    # Convert to grayscale once; the rest of the pipeline works on that buffer
+    return _process_gray_for_ocr(cv2.cvtColor(image, cv2.COLOR_BGR2GRAY))
+
+
 @handle_errors
 def extract_text_from_image(image_path: str) -> str:
     """Extract text from images using an enhanced OCR pipeline."""
     image = cv2.imread(image_path)
     if image is None:
         raise ValueError(f"Failed to load image from path: {image_path}")
-    
+
+    return _process_image_for_ocr(image)
+
+
+@handle_errors
+def extract_text_from_image_bytes(data: bytes) -> str:
+    """Extract text from an in-memory image without a disk round-trip."""
+    # imdecode reads straight from the byte buffer; a None result doubles
+    # as the corruption check that the path-based flow does via PIL
+    image = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        raise ValueError("Invalid or corrupted image file: could not decode image data")
+
     return _process_image_for_ocr(image)
 
 
+# Rasterization resolution for scanned pages. Tesseract accuracy plateaus
+# around 200 DPI for typical document fonts, and every downstream step scales
+# with pixel count, so start low and retry at 300 DPI only when the cheap
+# pass produces suspiciously little text.
+_OCR_DPI = 200
+_OCR_RETRY_DPI = 300
+_OCR_MIN_CHARS = 20
+
+
+def _render_page_gray(pdf_path: str, page_index: int, dpi: int) -> np.ndarray:
+    """Rasterize one PDF page to a grayscale ndarray without extra copies."""
+    # Render straight to a grayscale pixel buffer with PyMuPDF, skipping the
+    # pdfplumber -> PIL -> BGR conversion chain the old path went through
+    with fitz.open(pdf_path) as doc:
+        pix = doc[page_index].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY)
+    return np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width)
+
+
+def _ocr_page(pdf_path: str, page_index: int) -> str:
+    """
+    Rasterize a single PDF page and run OCR on it.
+    Opens its own PDF handle so it can run in a worker process.
+    """
+    logging.info(f"Processing page {page_index + 1} as an image...")
+    text = _process_gray_for_ocr(_render_page_gray(pdf_path, page_index, _OCR_DPI))
+
+    # Pages that yield almost nothing at the cheap resolution get one retry
+    # at high resolution; keep whichever pass read more
+    if len(text) < _OCR_MIN_CHARS:
+        logging.info(f"Retrying page {page_index + 1} at {_OCR_RETRY_DPI} DPI...")
+        retry_text = _process_gray_for_ocr(_render_page_gray(pdf_path, page_index, _OCR_RETRY_DPI))
+        if len(retry_text) > len(text):
+            text = retry_text
+
+    return text
+
+
 @handle_errors
 def extract_text_from_pdf(pdf_path: str) -> str:
     """
     Extract text from PDF documents.
-    Handles both text-based and image-based (scanned) PDFs.
+    Handles both text-based and image-based (scanned) PDFs, deciding per
+    page in a single pass so scanned documents are not traversed twice.
     """
-    text_parts = []
     with pdfplumber.open(pdf_path) as pdf:
-        # First, try to extract digital text
-        for page in pdf.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text_parts.append(page_text)
-        
-        full_text = "\n".join(text_parts).strip()
-        
-        # If no digital text is found, treat it as a scanned PDF
-        if not full_text:
-            logging.warning("No digital text found. Attempting OCR on PDF pages as images.")
-            image_text_parts = []
-            for i, page in enumerate(pdf.pages):
-                logging.info(f"Processing page {i+1} as an image...")
-                # Render page as a high-resolution image
-                pil_image = page.to_image(resolution=300).original
-                # Convert PIL image to OpenCV format (NumPy array)
-                cv_image = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
-                # Run the enhanced OCR process on the image
-                image_text_parts.append(_process_image_for_ocr(cv_image))
-            
-            full_text = "\n\n--- Page Break ---\n\n".join(image_text_parts)
-            
-    return full_text
+        # One pass: keep digital text where it exists, mark the rest for OCR
+        page_texts = [page.extract_text() for page in pdf.pages]
+
+    ocr_indices = [i for i, t in enumerate(page_texts) if not t]
+    if ocr_indices:
+        logging.warning(f"No digital text on {len(ocr_indices)} page(s). Attempting OCR on them as images.")
+        if len(ocr_indices) > 1:
+            # Page OCR is CPU-bound and independent per page, so fan it
+            # out across worker processes. `map` preserves page order.
+            # Spawn (not fork): Streamlit serves sessions on threads, and a
+            # forked child could inherit _TESS_LOCK held mid-OCR by another
+            # session's thread, deadlocking every worker.
+            with ProcessPoolExecutor(max_workers=os.cpu_count(),
+                                     mp_context=multiprocessing.get_context("spawn")) as executor:
+                ocr_texts = list(executor.map(partial(_ocr_page, pdf_path), ocr_indices))
+        else:
+            ocr_texts = [_ocr_page(pdf_path, ocr_indices[0])]
+        for i, text in zip(ocr_indices, ocr_texts):
+            page_texts[i] = text
+
+        return "\n\n--- Page Break ---\n\n".join(page_texts)
+
+    return "\n".join(page_texts).strip()
 
 
 @handle_errors
@@ -160,37 +324,58 @@ def process_upload(file_path: str) -> tuple[dict, str]:
     else:
         text = extract_text_from_pdf(file_path)
 
+    return _parse_document_text(text)
+
+
+def _parse_document_text(text: str) -> tuple[dict, str]:
+    """
+    Parse extracted document text into the field dict shared by all
+    upload flows.
+    """
     if not text.strip():
         raise ValueError("No text could be extracted from the document.")
 
-    # Define more flexible extraction patterns for different fields
-    # These patterns handle optional words and multi-line values.
-    patterns = {
-        "name": r"(?:Patient\s)?Name\s*:\s*([^\n]+)",
-        "age": r"Age\s*:\s*(\d+)",
-        "patient_id": r"(?:Insurance|Patient|Record)?\s*ID\s*[:\s]*([A-Z0-9-]+)",
-        "disease": r"(?:Disease|Diagnosis)\s*(?:Name)?\s*:\s*([^\n]+)",
-        "gender": r"Gender\s*:\s*([^\n]+)",
-        "blood": r"Blood(?:\sGroup)?\s*:\s*([^\n]+)",
-        # This pattern captures multi-line addresses by looking ahead for the next known field
-        "address": r"Address\s*:\s*([\s\S]+?)(?=\n(?:Phone|Contact|Gender|Blood|Medication)|$)",
-        "phone": r"(?:Phone|Contact)\s*(?:Number)?\s*:\s*([^\n]+)",
-        # This pattern captures a multi-line list of medications
-        "medicines": r"Medication[s]?\s*:\s*([\s\S]+?)(?=\n\n|\n[A-Z][a-z]+:|$) "
-    }
-    
-    fields = {}
-    for key, pattern in patterns.items():
-        match = re.search(pattern, text, re.IGNORECASE)
+    def clean(value: str) -> str:
+        # Clean up the extracted value: remove extra whitespace and newlines
+        return re.sub(r'\s+', ' ', value.strip().replace('\n', ' '))
+
+    fields = {key: "Not found" for key in _FIELD_KEYS}
+
+    # One sweep over the text picks up all single-line fields; the first
+    # occurrence of each field wins, matching the old per-pattern search
+    for match in _COMBINED_FIELD_RE.finditer(text):
+        key = match.lastgroup
+        if fields[key] == "Not found":
+            fields[key] = clean(match.group(key))
+
+    # The multi-line fields still need their own anchored searches
+    for key, pattern in _MULTILINE_FIELD_PATTERNS.items():
+        match = pattern.search(text)
         if match:
-            # Clean up the extracted value: remove extra whitespace and newlines
-            value = match.group(1).strip().replace('\n', ' ')
-            fields[key] = re.sub(r'\s+', ' ', value) # Consolidate whitespace
-        else:
-            fields[key] = "Not found"
-    
+            fields[key] = clean(match.group(1))
+
     # Consolidate Patient ID check
     if fields.get("patient_id") == "Not found":
         raise ValueError("Could not find a valid Insurance ID, Patient ID, or Record ID in the document.")
-            
+
     return fields, text
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def process_upload_bytes(file_bytes: bytes, suffix: str) -> tuple[dict, str]:
+    """
+    Process an uploaded document given its raw bytes and file suffix.
+    Extraction is purely a function of the file contents, so results are
+    cached by content hash — re-uploading the same document (or a Streamlit
+    rerun) returns instantly instead of re-running OCR.
+    """
+    suffix = suffix.lower()
+    if suffix in ('.png', '.jpg', '.jpeg'):
+        # Images decode straight from the byte buffer — no tempfile needed
+        return _parse_document_text(extract_text_from_image_bytes(file_bytes))
+
+    # pdfplumber/PyMuPDF want a path, so PDFs still go through a temp file
+    with tempfile.NamedTemporaryFile(suffix=suffix) as tmp:
+        tmp.write(file_bytes)
+        tmp.flush()
+        return process_upload(tmp.name)
@@ -35,6 +35,25 @@ MOCK_PATIENT_DATA = {
     }
 }
 
+# Fallback patterns for pulling fields straight out of the OCR text,
+# precompiled once at import so each lookup avoids rebuilding the dict
+# and recompiling the regex.
+_FALLBACK_PATTERNS = {field: re.compile(pattern, re.IGNORECASE) for field, pattern in {
+    "name": r"Name:\s*([^\n]+)",
+    "father": r"Father('s)? Name:\s*([^\n]+)",
+    "aadhar": r"Aadhar( Number)?:\s*([^\n]+)",
+    "gender": r"Gender:\s*([^\n]+)",
+    "blood": r"Blood( Group)?:\s*([^\n]+)",
+    "address": r"Address:\s*([^\n]+)",
+    "hospital": r"Hospital( Name)?:\s*([^\n]+)",
+    "phone": r"(Phone|Contact)( Number)?:\s*([^\n]+)",
+    "disease": r"(Disease|Condition|Diagnosis):\s*([^\n]+)",
+    "medicines": r"(Medicines|Medications|Drugs):\s*([^\n]+)",
+    "bed": r"Bed( Number)?:\s*([^\n]+)",
+    "amount": r"Amount:\s*([^\n]+)",
+    "charges": r"Charges:\s*([^\n]+)"
+}.items()}
+
 def handle_errors(func):
     """Error handling decorator for patient data functions"""
     def wrapper(*args, **kwargs):
@@ -61,42 +80,34 @@ def validate_field_name(field):
 def get_patient_data(insurance_id, field):
     """Get patient data from mock database or processed documents"""
     
-    # Check if insurance ID exists in mock data
-    if insurance_id in MOCK_PATIENT_DATA and field in MOCK_PATIENT_DATA[insurance_id]:
-        return MOCK_PATIENT_DATA[insurance_id][field]
-    
+    # Check if insurance ID exists in mock data (single hash lookup)
+    mock_data = MOCK_PATIENT_DATA.get(insurance_id)
+    if mock_data and field in mock_data:
+        return mock_data[field]
+
     # Check if insurance ID exists in processed data
-    elif insurance_id in st.session_state.processed_data:
-        patient_data = st.session_state.processed_data[insurance_id]
-        
+    patient_data = st.session_state.processed_data.get(insurance_id)
+    if patient_data:
         # Check if field exists in extracted fields
         if field in patient_data["fields"]:
             return patient_data["fields"][field]
-        
-        # If the field isn't in extracted fields, try to find it in the text using regex
-        elif "text" in patient_data:
-            text = patient_data["text"]
-            patterns = {
-                "name": r"Name:\s*([^\n]+)",
-                "father": r"Father('s)? Name:\s*([^\n]+)",
-                "aadhar": r"Aadhar( Number)?:\s*([^\n]+)",
-                "gender": r"Gender:\s*([^\n]+)",
-                "blood": r"Blood( Group)?:\s*([^\n]+)",
-                "address": r"Address:\s*([^\n]+)",
-                "hospital": r"Hospital( Name)?:\s*([^\n]+)",
-                "phone": r"(Phone|Contact)( Number)?:\s*([^\n]+)",
-                "disease": r"(Disease|Condition|Diagnosis):\s*([^\n]+)",
-                "medicines": r"(Medicines|Medications|Drugs):\s*([^\n]+)",
-                "bed": r"Bed( Number)?:\s*([^\n]+)",
-                "amount": r"Amount:\s*([^\n]+)",
-                "charges": r"Charges:\s*([^\n]+)"
-            }
-            
-            if field in patterns:
-                match = re.search(patterns[field], text, re.IGNORECASE)
-                if match:
-                    # Use the last capture group
-                    return match.group(len(match.groups())).strip()
+
+        # If the field isn't in extracted fields, try to find it in the text
+        # using regex — only worth touching the text for a known field.
+        # Successful extractions are memoized per (patient, field) so that
+        # repeated queries don't re-scan the full OCR text on every rerun.
+        if field in _FALLBACK_PATTERNS and "text" in patient_data:
+            field_cache = st.session_state.setdefault("field_cache", {})
+            cache_key = (insurance_id, field)
+            if cache_key in field_cache:
+                return field_cache[cache_key]
+
+            match = _FALLBACK_PATTERNS[field].search(patient_data["text"])
+            if match:
+                # Use the last capture group
+                value = match.group(len(match.groups())).strip()
+                field_cache[cache_key] = value
+                return value
     
     # If we get here, the data was not found
     return "Data not found for this patient."